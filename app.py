@@ -1,33 +1,73 @@
 # =====================================================================
 # EVENTLET MONKEY PATCHING - MUST BE AT THE ABSOLUTE TOP
 # Before ANY other imports including standard library
+# Patching socket/select/threading here is what makes PyMongo's blocking
+# I/O cooperative: a request waiting on MongoDB yields to other greenlets.
 # =====================================================================
 import eventlet
 eventlet.monkey_patch()
+from eventlet import tpool
 
 # Now safe to import everything else
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, stream_template, request, redirect, url_for, flash, make_response, session, g
+from flask.json.provider import JSONProvider
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_socketio import SocketIO, emit, join_room, leave_room
-from pymongo import MongoClient
+from jinja2 import FileSystemBytecodeCache
+from pymongo import MongoClient, UpdateOne, WriteConcern
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError, PyMongoError
 from bson import ObjectId
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+import click
 from dotenv import load_dotenv
 import os
-from datetime import datetime
+import re
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+import heapq
+import hashlib
+import hmac
+import math
+import orjson
 import secrets
+import threading
+import time
 
 load_dotenv()
 
+class ORJSONProvider(JSONProvider):
+    """Flask JSON provider backed by orjson; ObjectId and other unknown
+    types are serialized with str()"""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__, template_folder='templates')
+app.json = ORJSONProvider(app)
 app.secret_key = os.getenv('SECRET_KEY', secrets.token_hex(32))
 app.config['MONGO_URI'] = os.getenv('MONGO_URI')
+# Largest request body accepted; a full 50-question quiz form is well under this
+app.config['MAX_CONTENT_LENGTH'] = 512 * 1024
+# Render and Vercel put one proxy in front of the app; take the client address
+# it appends to X-Forwarded-For, so remote_addr is the client, not the proxy
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1)
+
+# Keep compiled templates on disk so fresh workers skip parsing/compiling them.
+# With no directory Jinja uses a per-user 0700 directory under the temp dir
+# and checks its owner and mode, so other users cannot plant bytecode there.
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache()
 
 # =====================================================================
 # FLASK-SOCKETIO INITIALIZATION (eventlet backend)
 # =====================================================================
 # Suppress noisy eventlet socket cleanup errors
 import logging
+import logging.handlers
 class SocketErrorFilter(logging.Filter):
     def filter(self, record):
         # Filter out the noisy "Bad file descriptor" errors from eventlet
@@ -41,57 +81,297 @@ logging.getLogger('werkzeug').addFilter(SocketErrorFilter())
 logging.getLogger('engineio.server').addFilter(SocketErrorFilter())
 logging.getLogger('socketio.server').addFilter(SocketErrorFilter())
 
+# App logger: handlers only enqueue records and a native OS thread writes them
+# to stderr, so a slow stderr stalls that thread rather than the eventlet hub.
+# The queue and thread come from the unpatched modules; after monkey_patch()
+# the stock ones would be green and the write would still run on the hub.
+# Per-event messages are DEBUG and suppressed by default (set
+# FLUX_LOG_LEVEL=DEBUG to see them).
+native_queue = eventlet.patcher.original('queue')
+native_threading = eventlet.patcher.original('threading')
+
+class NativeQueueListener(logging.handlers.QueueListener):
+    """QueueListener whose writer runs on a native OS thread"""
+    def start(self):
+        self._thread = native_threading.Thread(target=self._monitor, daemon=True)
+        self._thread.start()
+
+log_queue = native_queue.Queue()
+log_listener = NativeQueueListener(log_queue, logging.StreamHandler())
+log_listener.start()
+logger = logging.getLogger('flux')
+logger.addHandler(logging.handlers.QueueHandler(log_queue))
+logger.setLevel(os.getenv('FLUX_LOG_LEVEL', 'INFO').upper())
+logger.propagate = False
+
+class OrjsonSocketJSON:
+    """JSON module for Socket.IO packets backed by orjson (C encoder).
+    orjson output is always compact, so the separators argument is ignored;
+    ObjectId and other unknown types are sent as strings."""
+    @staticmethod
+    def dumps(obj, **kwargs):
+        return orjson.dumps(obj, default=str).decode()
+
+    @staticmethod
+    def loads(s, **kwargs):
+        return orjson.loads(s)
+
 socketio = SocketIO(
     app,
     async_mode='eventlet',
+    json=OrjsonSocketJSON,
     cors_allowed_origins="*",
     logger=False,  # Disable verbose logging (app is stable now)
     engineio_logger=False,  # Disable verbose logging
     ping_timeout=60,
-    ping_interval=25
+    ping_interval=25,
+    # Compress long-polling responses above ~512 bytes (leaderboards, questions);
+    # small events like score_update skip the compression overhead. WebSocket
+    # frames use permessage-deflate, which the server negotiates with browsers.
+    http_compression=True,
+    compression_threshold=512
 )
 
 # =====================================================================
 # GLOBAL STATE FOR LIVE QUIZ ARENA (in-memory, single instance)
 # =====================================================================
-# Structure: { quiz_id: { user_id: {'username': str, 'sid': str} } }
-live_players = {}
+# Per-quiz maps are defaultdicts so handlers can index a room directly; read
+# paths keep using .get() so unknown quiz ids never create empty entries.
+# Structure: { quiz_id: { user_id: {'username': str, 'sid': str, '_oid': ObjectId} } }
+live_players = defaultdict(dict)
 
 # Structure: { quiz_id: { user_id: score } }
-live_scores = {}
+live_scores = defaultdict(dict)
 
-# Structure: { quiz_id: { 'current_question': int, 'started': bool, 'master_id': str } }
-live_quiz_state = {}
+# Structure: { quiz_id: { 'current_question': int, 'started': bool, 'master_id': str,
+#                         '_oid': ObjectId, 'quiz': dict, 'questions': list, 'usernames': { user_id: str },
+#                         'last_broadcast_ts': float, 'player_list_dirty': bool,
+#                         'top10_set': set(user_ids), 'top10_min_score': int,
+#                         'last_active': float } }
+live_quiz_state = defaultdict(dict)
 
 # Structure: { quiz_id: set(user_ids) } - Players who signaled ready on live quiz page
-live_ready_players = {}
+live_ready_players = defaultdict(set)
+
+# Structure: { sid: (quiz_id, user_id) } - Reverse lookup used on disconnect
+sid_to_location = {}
+
+# Minimum seconds between full leaderboard broadcasts; submissions in between
+# only send a small score_delta that clients patch into their leaderboard
+LEADERBOARD_BROADCAST_INTERVAL = 0.5
+
+# Seconds to wait before broadcasting a changed player list, so a burst of
+# joins/leaves produces a single player_list event per room
+PLAYER_LIST_FLUSH_DELAY = 0.2
+
+# Seconds after which a lobby that never started (or was abandoned) is
+# dropped from memory
+LIVE_STATE_TTL = 3600
+
+def discard_live_quiz(quiz_id):
+    """Remove every in-memory trace of a live quiz"""
+    for player_info in live_players.pop(quiz_id, {}).values():
+        sid_to_location.pop(player_info.get('sid'), None)
+    live_scores.pop(quiz_id, None)
+    live_quiz_state.pop(quiz_id, None)
+    live_ready_players.pop(quiz_id, None)
+
+def prune_stale_live_quizzes():
+    """Drop lobbies that are not running and saw no activity for LIVE_STATE_TTL"""
+    cutoff = time.monotonic() - LIVE_STATE_TTL
+    stale = [
+        quiz_id for quiz_id, state in live_quiz_state.items()
+        if not state.get('started') and state.get('last_active', 0) < cutoff
+    ]
+    for quiz_id in stale:
+        discard_live_quiz(quiz_id)
+        logger.info("[SocketIO] Dropped stale lobby state for quiz %s", quiz_id)
 
 # =====================================================================
 # LAZY MONGODB CONNECTION
 # =====================================================================
 client = None
 db = None
+results_fast = None  # results with RESULTS_WRITE_CONCERN, bound with db
+db_lock = threading.Lock()
+
+# Score records are acknowledged by the primary alone: a majority ack adds a
+# replication round trip to every submission, and only a failover inside that
+# window could roll one back. Users and quizzes keep the default concern.
+RESULTS_WRITE_CONCERN = WriteConcern(w=1)
+
+# Indexes backing the hot queries: (collection, keys, options)
+INDEXES = [
+    ('users', [('email', 1)], {'unique': True}),                # login and registration
+    ('users', [('username', 1)], {'unique': True}),             # registration
+    ('quizzes', [('createdBy', 1), ('date', -1)], {}),          # master quiz list (equality, then sort)
+    ('quizzes', [('date', -1)], {}),                            # quiz list sort
+    ('results', [('quiz_id', 1), ('mode', 1), ('score', -1)], {}),  # arena standings
+    ('results', [('user', 1), ('date', -1)], {}),               # solo results history
+    ('results', [('student_id', 1), ('date', -1)], {}),         # live arena results history
+    ('results', [('mode', 1), ('date', -1)], {}),               # arena history grouping
+    ('results', [('user', 1), ('attempt', 1)],                  # one result per solo attempt
+     {'unique': True, 'partialFilterExpression': {'attempt': {'$exists': True}}}),
+    ('leaderboard', [('totalScore', -1)], {}),                  # global top 10
+]
+
+def ensure_indexes(db):
+    """Create the indexes in INDEXES (no-op for ones that already exist)"""
+    for collection, keys, options in INDEXES:
+        try:
+            db[collection].create_index(keys, **options)
+        except ConnectionFailure as e:
+            logger.error("Skipping index creation, database unreachable: %s", e)
+            return
+        except PyMongoError as e:
+            logger.error("Failed to create index %s on %s: %s", keys, collection, e)
+
+def rebuild_leaderboard(db):
+    """Recompute every student's leaderboard total from the solo results"""
+    db['results'].aggregate([
+        {'$match': {'user': {'$exists': True}, 'score': {'$exists': True}}},
+        {'$group': {'_id': '$user', 'totalScore': {'$sum': '$score'}}},
+        {'$lookup': {
+            'from': 'users',
+            'localField': '_id',
+            'foreignField': '_id',
+            'pipeline': [{'$project': {'username': 1}}],
+            'as': 'u'
+        }},
+        {'$project': {
+            'totalScore': 1,
+            'username': {'$ifNull': [{'$arrayElemAt': ['$u.username', 0]}, 'Unknown Student']}
+        }},
+        {'$merge': {'into': 'leaderboard', 'whenMatched': 'replace'}}
+    ])
+    # Only a completed rebuild marks the board as seeded
+    db['meta'].update_one({'_id': 'leaderboard'}, {'$set': {'seeded': True}}, upsert=True)
+
+# A seed claimed by an instance that never finished it can be taken over
+# after this long
+LEADERBOARD_SEED_CLAIM = timedelta(minutes=10)
+
+def ensure_leaderboard(db):
+    """Seed the precomputed leaderboard from the results once per database.
+    The meta 'leaderboard' document records a completed seed; an instance
+    claims the seed in it first, so two cold starts do not rebuild at once."""
+    meta = db['meta']
+    now = datetime.now(timezone.utc)
+    try:
+        meta.update_one(
+            {'_id': 'leaderboard', 'seeded': {'$ne': True},
+             '$or': [{'claimed_at': {'$exists': False}},
+                     {'claimed_at': {'$lt': now - LEADERBOARD_SEED_CLAIM}}]},
+            {'$set': {'claimed_at': now}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return  # already seeded, or another instance is seeding it
+    except PyMongoError as e:
+        logger.error("Failed to claim the leaderboard seed, retrying on the next start: %s", e)
+        return
+    try:
+        rebuild_leaderboard(db)
+        logger.info("Seeded the leaderboard from existing results")
+    except PyMongoError as e:
+        logger.error("Failed to seed the leaderboard, retrying on the next start: %s", e)
+        try:
+            meta.update_one({'_id': 'leaderboard', 'seeded': {'$ne': True}},
+                            {'$unset': {'claimed_at': ''}})
+        except PyMongoError:
+            pass  # the claim expires after LEADERBOARD_SEED_CLAIM
+
+@app.cli.command('rebuild-leaderboard')
+def rebuild_leaderboard_command():
+    """Repair leaderboard totals from the results (e.g. after a failed update in submit_quiz).
+    Run while no submissions are in flight: one landing mid-rebuild can be
+    counted twice."""
+    rebuild_leaderboard(get_db())
+    click.echo("[FLUX] Leaderboard rebuilt from results")
+
+def backfill_total_points(db):
+    """Store total_points on quizzes created before it was tracked"""
+    return db['quizzes'].update_many(
+        {'total_points': {'$exists': False}},
+        [{'$set': {'total_points': {'$reduce': {
+            'input': {'$ifNull': ['$questions', []]},
+            'initialValue': 0,
+            'in': {'$add': ['$$value', {'$ifNull': ['$$this.points', 1]}]}
+        }}}}]
+    ).modified_count
+
+@app.cli.command('backfill-total-points')
+def backfill_total_points_command():
+    """Store total_points on quizzes saved before it was tracked. Until then
+    those quizzes have their question points summed on every read."""
+    count = backfill_total_points(get_db())
+    click.echo(f"[FLUX] Stored total_points on {count} quizzes")
+
+def quiz_total_points(quiz):
+    """Points available in quiz: the stored total_points, or for quizzes not
+    yet backfilled the sum of the question points (quiz must carry
+    questions.points)"""
+    total = quiz.get('total_points')
+    if total is None:
+        total = sum(q.get('points', 1) for q in quiz.get('questions', []))
+    return total
 
 def get_db():
-    global client, db
-    if client is None:
-        mongo_uri = app.config['MONGO_URI']
-        if not mongo_uri:
-            raise ValueError("MONGO_URI not set. Check environment variables.")
-        client = MongoClient(
-            mongo_uri,
-            serverSelectionTimeoutMS=5000,
-            connectTimeoutMS=5000,
-            maxPoolSize=50,
-            retryWrites=True
-        )
-        db = client['flux_db']
+    global client, db, results_fast
+    if db is None:
+        # Parallel first requests would otherwise each build a client (SRV
+        # lookup and index builds yield to other greenlets mid-setup)
+        with db_lock:
+            if db is None:
+                mongo_uri = app.config['MONGO_URI']
+                if not mongo_uri:
+                    raise ValueError("MONGO_URI not set. Check environment variables.")
+                client = MongoClient(
+                    mongo_uri,
+                    serverSelectionTimeoutMS=5000,
+                    connectTimeoutMS=5000,
+                    maxPoolSize=200,            # one eventlet worker multiplexes many requests
+                    minPoolSize=10,             # keep warm sockets so bursts skip the TLS/auth handshake
+                    maxIdleTimeMS=300000,       # recycle idle sockets before the server/LB drops them
+                    socketTimeoutMS=45000,      # a stalled operation errors instead of pinning a socket
+                    waitQueueTimeoutMS=2000,    # fail fast instead of queueing forever when the pool is exhausted
+                    appname='quizz-app',        # attributes operations in server logs and the profiler
+                    retryWrites=True
+                )
+                new_db = client['flux_db']
+                ensure_indexes(new_db)
+                ensure_leaderboard(new_db)
+                results_fast = new_db.get_collection('results', write_concern=RESULTS_WRITE_CONCERN)
+                db = new_db
     return db
 
 def get_collections():
     db = get_db()
     return db['users'], db['quizzes'], db['results']
 
+def parse_oid(value):
+    """Return value as an ObjectId, or None if it is not a valid id"""
+    return ObjectId(value) if ObjectId.is_valid(value) else None
+
+def get_leaderboard_col():
+    """Precomputed per-student totals: { _id: user ObjectId, username, totalScore }"""
+    return get_db()['leaderboard']
+
+def get_results_writer():
+    """The results collection with RESULTS_WRITE_CONCERN, for score inserts"""
+    get_db()
+    return results_fast
+
+# Endpoints that never touch the database
+NO_DB_ENDPOINTS = {'static', 'health_check', 'index'}
+
+@app.before_request
+def attach_collections():
+    """Resolve the collections once per request for the views (g.users etc.)"""
+    if request.endpoint in NO_DB_ENDPOINTS:
+        return
+    g.users, g.quizzes, g.results = get_collections()
+
 # =====================================================================
 # FLASK-LOGIN SETUP
 # =====================================================================
@@ -99,64 +379,212 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+# New passwords are hashed with argon2id at the OWASP baseline (2 passes
+# over 19 MiB), a fraction of the CPU of the scrypt/pbkdf2 hashes Werkzeug
+# produced before. Those older hashes still verify and are replaced with an
+# argon2 hash on the next successful login.
+password_hasher = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
+def _check_password(password_hash, password):
+    if password_hash.startswith('$argon2'):
+        try:
+            return password_hasher.verify(password_hash, password)
+        except (VerificationError, InvalidHashError):
+            return False
+    return check_password_hash(password_hash, password)
+
+# Password hashing is CPU-bound C code that eventlet cannot yield from, so it
+# runs in eventlet's native thread pool to keep socket traffic flowing
+def hash_password(password):
+    return tpool.execute(password_hasher.hash, password)
+
+def verify_password(password_hash, password):
+    return tpool.execute(_check_password, password_hash, password)
+
+def password_needs_rehash(password_hash):
+    """True for legacy Werkzeug hashes and argon2 hashes with old parameters"""
+    return (not password_hash.startswith('$argon2')
+            or password_hasher.check_needs_rehash(password_hash))
+
+# Compared against on failed lookups. New and upgraded accounts hold argon2
+# hashes, so an unknown email costs the same verify as a wrong password.
+DUMMY_PASSWORD_HASH = password_hasher.hash(secrets.token_hex(16))
+
+# Recent successful logins, so a client that re-authenticates in a burst
+# (refreshes, flaky networks) skips the KDF. Keyed by an HMAC of the
+# credentials under a per-process key, so no password is held in memory.
+# A hit still needs the account to exist with the same stored hash, so a
+# deleted account or a changed password is not served from the cache.
+LOGIN_CACHE_TTL = 60
+LOGIN_CACHE_MAX = 1000
+LOGIN_CACHE_KEY = secrets.token_bytes(32)
+login_cache = {}  # { digest: (expires_at, stored password hash) }, oldest entry first
+
+def login_cache_digest(email, role, password):
+    message = '\0'.join((email, role, password)).encode()
+    return hmac.new(LOGIN_CACHE_KEY, message, hashlib.sha256).digest()
+
+# Failed logins per client address, so one client cannot keep guessing
+# passwords (or probing login_cache). Only failures count: a class logging
+# in from behind one school NAT is not throttled.
+LOGIN_FAILURE_LIMIT = 20
+LOGIN_FAILURE_WINDOW = 60
+LOGIN_FAILURE_MAX_ADDRS = 10000
+login_failures = {}  # { remote_addr: (window_ends_at, count) }, oldest entry first
+
+def login_throttled(addr):
+    """True when addr used up its failed logins for the current window"""
+    entry = login_failures.get(addr)
+    return bool(entry) and entry[0] > time.monotonic() and entry[1] >= LOGIN_FAILURE_LIMIT
+
+def record_login_failure(addr):
+    now = time.monotonic()
+    entry = login_failures.pop(addr, None)
+    if entry and entry[0] > now:
+        login_failures[addr] = (entry[0], entry[1] + 1)
+        return
+    if len(login_failures) >= LOGIN_FAILURE_MAX_ADDRS:
+        login_failures.pop(next(iter(login_failures)))
+    login_failures[addr] = (now + LOGIN_FAILURE_WINDOW, 1)
+
 class User(UserMixin):
     def __init__(self, id, username, role):
         self.id = str(id)
+        self.id_oid = ObjectId(self.id)  # for comparing against stored ObjectIds
         self.username = username
         self.role = role
 
+# Flask-Login reloads the user on every request. The signed session cookie
+# carries username/role, so most requests rebuild the user without a database
+# read; the account is looked up again every USER_RECHECK_SECONDS, so a
+# deleted account or a changed role takes effect within that window.
+USER_RECHECK_SECONDS = 300
+
+def remember_user(user):
+    """Keep username/role in the session cookie, stamped with the check time"""
+    session['u_name'] = user.username
+    session['u_role'] = user.role
+    session['u_checked'] = time.time()
+
+def start_session(user):
+    """Log the user in and remember them in the session cookie"""
+    login_user(user)
+    remember_user(user)
+
 @login_manager.user_loader
 def load_user(user_id):
+    if (session.get('_user_id') == user_id and 'u_name' in session
+            and time.time() - session.get('u_checked', 0) < USER_RECHECK_SECONDS):
+        return User(user_id, session['u_name'], session['u_role'])
     try:
         users, _, _ = get_collections()
-        user_data = users.find_one({'_id': ObjectId(user_id)})
+        user_data = users.find_one({'_id': ObjectId(user_id)}, {'username': 1, 'role': 1})
         if user_data:
-            return User(str(user_data['_id']), user_data['username'], user_data['role'])
-    except Exception as e:
-        print(f"Error loading user: {e}")
+            user = User(str(user_data['_id']), user_data['username'], user_data['role'])
+            remember_user(user)
+            return user
+    except Exception:
+        logger.exception("Error loading user %s", user_id)
     return None
 
 @app.errorhandler(500)
 def internal_server_error(e):
     return render_template('500.html', error=e), 500
 
+@app.errorhandler(413)
+def request_entity_too_large(e):
+    flash('Submission is too large')
+    return redirect(url_for('dashboard'))
+
+def render_conditional(etag, template, **context):
+    """Render template tagged with etag, or answer 304 without rendering
+    when the browser already holds that version"""
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        response = make_response(render_template(template, **context))
+    response.set_etag(etag)
+    # Private (per-user page) and always revalidated, so edits show up at once
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+# Changes per process so a deploy with new templates invalidates old ETags
+ETAG_BUILD = secrets.token_hex(4)
+
+def quiz_etag(quiz):
+    """ETag for a quiz page as seen by the current user; edit_quiz bumps
+    the quiz date on every save"""
+    date = quiz.get('date')
+    version = int(date.timestamp() * 1000) if date else 0
+    return f"{quiz['_id']}-{version}-{current_user.id}-{ETAG_BUILD}"
+
 # =====================================================================
 # HEALTH CHECK ENDPOINT (keeps Render instance warm)
 # =====================================================================
 @app.route('/health')
 def health_check():
     """Health check endpoint for monitoring and keeping instance warm"""
-    return {'status': 'healthy', 'timestamp': datetime.now().isoformat()}, 200
+    return {'status': 'healthy', 'timestamp': datetime.now(timezone.utc).isoformat()}, 200
 
 # =====================================================================
 # SOCKETIO EVENT HANDLERS
 # =====================================================================
+def schedule_player_list(quiz_id):
+    """Coalesce player_list broadcasts for a room into one per flush window"""
+    state = live_quiz_state[quiz_id]
+    if state.get('player_list_dirty'):
+        return
+    state['player_list_dirty'] = True
+    socketio.start_background_task(flush_player_list, quiz_id)
+
+def flush_player_list(quiz_id):
+    """Background task that broadcasts the player list once the window closes"""
+    socketio.sleep(PLAYER_LIST_FLUSH_DELAY)
+    state = live_quiz_state.get(quiz_id)
+    if state is None:
+        return
+    state['player_list_dirty'] = False
+    socketio.emit('player_list', {
+        'players': [
+            {'user_id': uid, 'username': p['username']}
+            for uid, p in live_players.get(quiz_id, {}).items()
+        ]
+    }, room=f"quiz_{quiz_id}")
+
 @socketio.on('ping')
 def handle_ping():
     """Handle keep-alive ping from client"""
-    emit('pong', {'timestamp': datetime.now().isoformat()})
+    emit('pong', {'timestamp': datetime.now(timezone.utc).isoformat()})
 
 @socketio.on('connect')
 def handle_connect():
-    print(f"[SocketIO] Client connected: {request.sid}")
+    logger.debug("[SocketIO] Client connected: %s", request.sid)
+
+def invalidate_top10(quiz_id):
+    """Forget the cached top-10 membership after a player leaves, so the next
+    correct answer recomputes it instead of being skipped against stale data"""
+    state = live_quiz_state.get(quiz_id)
+    if state:
+        state.pop('top10_set', None)
+        state.pop('top10_min_score', None)
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    print(f"[SocketIO] Client disconnected: {request.sid}")
-    # Clean up player from any live quiz rooms
-    for quiz_id in list(live_players.keys()):
-        players = live_players.get(quiz_id, {})
-        for user_id, info in list(players.items()):
-            if info.get('sid') == request.sid:
-                del live_players[quiz_id][user_id]
-                # Broadcast updated player list
-                emit('player_list', {
-                    'players': [
-                        {'user_id': uid, 'username': p['username']}
-                        for uid, p in live_players.get(quiz_id, {}).items()
-                    ]
-                }, room=f"quiz_{quiz_id}")
-                print(f"[SocketIO] Removed {info['username']} from quiz {quiz_id}")
+    logger.debug("[SocketIO] Client disconnected: %s", request.sid)
+    # Clean up player from the live quiz room this socket joined
+    location = sid_to_location.pop(request.sid, None)
+    if not location:
+        return
+    quiz_id, user_id = location
+    info = live_players.get(quiz_id, {}).get(user_id)
+    if info and info.get('sid') == request.sid:
+        del live_players[quiz_id][user_id]
+        live_quiz_state.get(quiz_id, {}).get('usernames', {}).pop(user_id, None)
+        invalidate_top10(quiz_id)
+        # Broadcast updated player list
+        schedule_player_list(quiz_id)
+        logger.info("[SocketIO] Removed %s from quiz %s", info['username'], quiz_id)
 
 @socketio.on('join_lobby')
 def handle_join_lobby(data):
@@ -168,48 +596,47 @@ def handle_join_lobby(data):
     if not quiz_id or not user_id or not username:
         emit('error', {'message': 'Missing required data'})
         return
+    if not ObjectId.is_valid(user_id):
+        emit('error', {'message': 'Invalid user ID'})
+        return
     
     room = f"quiz_{quiz_id}"
     
-    # Initialize quiz in live_players if not exists
-    if quiz_id not in live_players:
-        live_players[quiz_id] = {}
+    players = live_players[quiz_id]
+    scores = live_scores[quiz_id]
     
     # Check if this is a rejoin (player was previously in this quiz)
-    is_rejoin = user_id in live_players.get(quiz_id, {})
-    previous_score = 0
-    if quiz_id in live_scores and user_id in live_scores[quiz_id]:
-        previous_score = live_scores[quiz_id][user_id]
+    is_rejoin = user_id in players
+    previous_score = scores.get(user_id, 0)
     
-    # Add player to the room
+    # Add player to the room (replacing the socket of a previous connection)
     join_room(room)
-    live_players[quiz_id][user_id] = {
+    if is_rejoin:
+        sid_to_location.pop(players[user_id].get('sid'), None)
+    sid_to_location[request.sid] = (quiz_id, user_id)
+    players[user_id] = {
         'username': username,
-        'sid': request.sid
+        'sid': request.sid,
+        '_oid': ObjectId(user_id)  # parsed once, reused when saving results
     }
+    # Flat username map read by the leaderboard broadcast
+    live_quiz_state[quiz_id].setdefault('usernames', {})[user_id] = username
+    live_quiz_state[quiz_id]['last_active'] = time.monotonic()
     
     # Initialize or keep existing score for this player
-    if quiz_id not in live_scores:
-        live_scores[quiz_id] = {}
-    if user_id not in live_scores[quiz_id]:
-        live_scores[quiz_id][user_id] = 0
+    scores.setdefault(user_id, 0)
     
     # Check if quiz is already in progress (for rejoin support)
     quiz_state = live_quiz_state.get(quiz_id, {})
     is_quiz_started = quiz_state.get('started', False)
     
     if is_rejoin:
-        print(f"[SocketIO] {username} REJOINED quiz {quiz_id} (score: {previous_score})")
+        logger.info("[SocketIO] %s REJOINED quiz %s (score: %s)", username, quiz_id, previous_score)
     else:
-        print(f"[SocketIO] {username} joined lobby for quiz {quiz_id}")
+        logger.info("[SocketIO] %s joined lobby for quiz %s", username, quiz_id)
     
     # Broadcast updated player list to everyone in the room
-    emit('player_list', {
-        'players': [
-            {'user_id': uid, 'username': p['username']}
-            for uid, p in live_players[quiz_id].items()
-        ]
-    }, room=room)
+    schedule_player_list(quiz_id)
     
     # Confirm join to the player with rejoin info
     emit('joined', {
@@ -224,7 +651,8 @@ def handle_join_lobby(data):
     if is_quiz_started and quiz_state.get('current_question_data'):
         current_q = quiz_state.get('current_question_data')
         time_remaining = quiz_state.get('time_remaining', 30)
-        print(f"[SocketIO] Sending current question to {username} (Q{current_q.get('index', 0) + 1}, {time_remaining}s left)")
+        logger.debug("[SocketIO] Sending current question to %s (Q%s, %ss left)",
+                     username, current_q.get('index', 0) + 1, time_remaining)
         emit('new_question', current_q)
         # Also send reduced time so they know how much time is left
         emit('sync_timer', {'time_remaining': time_remaining})
@@ -238,13 +666,13 @@ def handle_player_ready(data):
     
     if not quiz_id or not user_id:
         return
-    
-    # Initialize set if needed
-    if quiz_id not in live_ready_players:
-        live_ready_players[quiz_id] = set()
+    # Only rooms with live state are pruned, so unknown quiz ids are ignored
+    # rather than growing live_ready_players forever
+    if quiz_id not in live_quiz_state:
+        return
     
     live_ready_players[quiz_id].add(user_id)
-    print(f"[SocketIO] Player {user_id} ready for quiz {quiz_id}")
+    logger.debug("[SocketIO] Player %s ready for quiz %s", user_id, quiz_id)
     
     # Emit ready count to all players
     room = f"quiz_{quiz_id}"
@@ -268,16 +696,14 @@ def handle_leave_lobby(data):
         
         if quiz_id in live_players and user_id in live_players[quiz_id]:
             username = live_players[quiz_id][user_id].get('username', 'Unknown')
+            sid_to_location.pop(live_players[quiz_id][user_id].get('sid'), None)
             del live_players[quiz_id][user_id]
-            print(f"[SocketIO] {username} left lobby for quiz {quiz_id}")
+            live_quiz_state.get(quiz_id, {}).get('usernames', {}).pop(user_id, None)
+            invalidate_top10(quiz_id)
+            logger.info("[SocketIO] %s left lobby for quiz %s", username, quiz_id)
             
             # Broadcast updated player list
-            emit('player_list', {
-                'players': [
-                    {'user_id': uid, 'username': p['username']}
-                    for uid, p in live_players.get(quiz_id, {}).items()
-                ]
-            }, room=room)
+            schedule_player_list(quiz_id)
 
 @socketio.on('kick_player')
 def handle_kick_player(data):
@@ -305,23 +731,21 @@ def handle_kick_player(data):
         username = player_info.get('username', 'Unknown')
         
         # Remove from data structures
+        sid_to_location.pop(player_sid, None)
         del live_players[quiz_id][target_user_id]
+        live_quiz_state.get(quiz_id, {}).get('usernames', {}).pop(target_user_id, None)
         if quiz_id in live_scores and target_user_id in live_scores[quiz_id]:
             del live_scores[quiz_id][target_user_id]
+        invalidate_top10(quiz_id)
         
         # Notify the kicked player
         if player_sid:
             socketio.emit('kicked', {'message': 'You have been removed from this quiz'}, room=player_sid)
         
-        print(f"[SocketIO] {username} was kicked from quiz {quiz_id} by master")
+        logger.info("[SocketIO] %s was kicked from quiz %s by master", username, quiz_id)
         
         # Broadcast updated player list
-        emit('player_list', {
-            'players': [
-                {'user_id': uid, 'username': p['username']}
-                for uid, p in live_players.get(quiz_id, {}).items()
-            ]
-        }, room=room)
+        schedule_player_list(quiz_id)
         
         emit('player_kicked', {'username': username}, room=room)
 
@@ -351,7 +775,7 @@ def handle_start_quiz(data):
     live_quiz_state[quiz_id]['current_question'] = 0
     
     room = f"quiz_{quiz_id}"
-    print(f"[SocketIO] Quiz {quiz_id} started by master {user_id}")
+    logger.info("[SocketIO] Quiz %s started by master %s", quiz_id, user_id)
     
     # Notify all players to redirect to live quiz page
     emit('quiz_started', {
@@ -362,20 +786,40 @@ def handle_start_quiz(data):
     # Start sending questions after a short delay (give time to redirect)
     socketio.start_background_task(send_questions_task, quiz_id)
 
+def normalize_answer(q_type, answer):
+    """Normalize an answer for comparison based on question type"""
+    answer = str(answer).strip()
+    if q_type == 'tf':
+        return answer.upper()
+    if q_type == 'short':
+        return answer.lower()
+    return answer
+
 def send_questions_task(quiz_id):
     """Background task to send questions one by one with timer"""
-    import time
-    
     _, quizzes_col, _ = get_collections()
-    quiz = quizzes_col.find_one({'_id': ObjectId(quiz_id)})
+    # Only the title and questions are needed for the live session
+    quiz = quizzes_col.find_one({'_id': live_quiz_state[quiz_id]['_oid']},
+                                {'title': 1, 'questions': 1, 'total_points': 1})
     
     if not quiz:
-        print(f"[SocketIO] Quiz {quiz_id} not found")
+        logger.warning("[SocketIO] Quiz %s not found", quiz_id)
         return
     
     questions = quiz.get('questions', [])
     room = f"quiz_{quiz_id}"
     
+    # Normalize correct answers once instead of on every submission
+    for question in questions:
+        question['_norm_answer'] = question.get('answer_norm')
+        if question['_norm_answer'] is None:  # quizzes saved before answer_norm existed
+            question['_norm_answer'] = normalize_answer(question.get('type', 'mcq'), question.get('answer', ''))
+    
+    # Cache the quiz for answer grading (avoids a DB fetch per submission)
+    if quiz_id in live_quiz_state:
+        live_quiz_state[quiz_id]['quiz'] = quiz
+        live_quiz_state[quiz_id]['questions'] = questions
+    
     # =========================================================
     # WAIT FOR PLAYERS TO BE READY (with timeout)
     # =========================================================
@@ -386,14 +830,14 @@ def send_questions_task(quiz_id):
         total_players = len(live_players.get(quiz_id, {}))
         ready_players = len(live_ready_players.get(quiz_id, set()))
         
-        print(f"[SocketIO] Quiz {quiz_id}: {ready_players}/{total_players} players ready")
+        logger.debug("[SocketIO] Quiz %s: %s/%s players ready", quiz_id, ready_players, total_players)
         
         # Start when all players are ready, or at least 1 after 10s
         if ready_players >= total_players and total_players > 0:
-            print(f"[SocketIO] All players ready, starting quiz {quiz_id}")
+            logger.info("[SocketIO] All players ready, starting quiz %s", quiz_id)
             break
         if waited >= 10 and ready_players >= 1:
-            print(f"[SocketIO] Timeout, starting quiz {quiz_id} with {ready_players} ready players")
+            logger.info("[SocketIO] Timeout, starting quiz %s with %s ready players", quiz_id, ready_players)
             break
             
         socketio.sleep(1)
@@ -407,7 +851,7 @@ def send_questions_task(quiz_id):
         try:
             # Check if quiz was cancelled
             if quiz_id not in live_quiz_state or not live_quiz_state[quiz_id].get('started'):
-                print(f"[SocketIO] Quiz {quiz_id} cancelled, breaking at question {idx}")
+                logger.info("[SocketIO] Quiz %s cancelled, breaking at question %s", quiz_id, idx)
                 break
             
             live_quiz_state[quiz_id]['current_question'] = idx
@@ -433,18 +877,27 @@ def send_questions_task(quiz_id):
             live_quiz_state[quiz_id]['current_question_data'] = question_data
             live_quiz_state[quiz_id]['time_remaining'] = time_for_question
             
-            print(f"[SocketIO] Sending question {idx + 1}/{len(questions)} for quiz {quiz_id} ({time_for_question}s)")
+            # Fix the deadline before emitting so slow emits don't delay the timer
+            deadline = time.monotonic() + time_for_question
+            
+            logger.info("[SocketIO] Sending question %s/%s for quiz %s (%ss)",
+                        idx + 1, len(questions), quiz_id, time_for_question)
             
             # Broadcast question to all players (wrap in try for socket safety)
             try:
                 socketio.emit('new_question', question_data, room=room)
             except Exception as e:
-                print(f"[SocketIO] Error emitting question: {e}")
+                logger.error("[SocketIO] Error emitting question: %s", e)
             
-            # Wait for this question's time limit (track remaining time for reconnecting players)
-            for t in range(time_for_question, 0, -1):
-                live_quiz_state[quiz_id]['time_remaining'] = t
-                socketio.sleep(1)
+            # Wait until the deadline in steps of at most 1s, tracking remaining
+            # time for reconnecting players and stopping promptly if cancelled
+            remaining = time_for_question
+            while remaining > 0 and live_quiz_state.get(quiz_id, {}).get('started'):
+                live_quiz_state[quiz_id]['time_remaining'] = math.ceil(remaining)
+                socketio.sleep(min(1, remaining))
+                remaining = deadline - time.monotonic()
+            if remaining > 0:
+                continue  # cancelled: the check at the top of the loop stops the quiz
             
             # Broadcast time up with correct answer revealed
             try:
@@ -454,92 +907,99 @@ def send_questions_task(quiz_id):
                     'question_type': question.get('type')
                 }, room=room)
             except Exception as e:
-                print(f"[SocketIO] Error emitting time_up: {e}")
+                logger.error("[SocketIO] Error emitting time_up: %s", e)
             
             # Short pause between questions
             socketio.sleep(2)
             
-        except Exception as e:
-            print(f"[SocketIO] Error in question loop at {idx}: {e}")
+        except Exception:
+            logger.exception("[SocketIO] Error in question loop at %s", idx)
             # Continue to next question instead of crashing
             continue
     
     # Quiz ended - mark as stopped first, then save results
-    print(f"[SocketIO] Quiz {quiz_id} completed all {len(questions)} questions")
+    logger.info("[SocketIO] Quiz %s completed all %s questions", quiz_id, len(questions))
     if quiz_id in live_quiz_state:
         live_quiz_state[quiz_id]['started'] = False
     
     try:
         socketio.emit('quiz_ended', {'quiz_id': quiz_id}, room=room)
     except Exception as e:
-        print(f"[SocketIO] Error emitting quiz_ended: {e}")
-    print(f"[SocketIO] Quiz {quiz_id} ended")
+        logger.error("[SocketIO] Error emitting quiz_ended: %s", e)
+    logger.info("[SocketIO] Quiz %s ended", quiz_id)
     
     # Save results to MongoDB (this also cleans up state)
     save_live_quiz_results(quiz_id, quiz)
 
 def save_live_quiz_results(quiz_id, quiz):
     """Save all player results from live quiz to MongoDB"""
-    users_col, _, results_col = get_collections()
-    
     scores = live_scores.get(quiz_id, {})
     players = live_players.get(quiz_id, {})
     
     if not scores:
-        print(f"[SocketIO] No scores to save for quiz {quiz_id}")
+        logger.info("[SocketIO] No scores to save for quiz %s", quiz_id)
         return
     
-    # Calculate total possible points
-    total_possible = sum(q.get('points', 1) for q in quiz.get('questions', []))
+    total_possible = quiz_total_points(quiz)
+    quiz_oid = quiz['_id']
+    # One clock read per batch so every result from this session shares a date
+    now = datetime.now(timezone.utc)
     
-    saved_count = 0
+    operations = []
+    usernames = []
     for user_id, score in scores.items():
         player_info = players.get(user_id, {})
         username = player_info.get('username', 'Unknown')
+        # Players who disconnected have no cached ObjectId
+        student_oid = player_info.get('_oid') or ObjectId(user_id)
         
         # Calculate percentage
         percentage = round((score / total_possible * 100), 1) if total_possible > 0 else 0
         
         # Create result document (matching existing results structure)
         result_doc = {
-            'quiz_id': ObjectId(quiz_id),
+            'quiz_id': quiz_oid,
             'quiz_title': quiz.get('title', 'Unknown Quiz'),
-            'student_id': ObjectId(user_id),
+            'student_id': student_oid,
             'student_name': username,
             'score': score,
             'total_possible': total_possible,
             'percentage': percentage,
             'mode': 'live_arena',  # Mark as live arena result
-            'date': datetime.now()
+            'date': now
         }
         
-        try:
-            # Use upsert to prevent duplicates (same player, same quiz, same mode)
-            results_col.update_one(
-                {
-                    'quiz_id': ObjectId(quiz_id),
-                    'student_id': ObjectId(user_id),
-                    'mode': 'live_arena'
-                },
-                {'$set': result_doc},
-                upsert=True
-            )
-            saved_count += 1
-            print(f"[SocketIO] Saved result for {username}: {score}/{total_possible} ({percentage}%)")
-        except Exception as e:
-            print(f"[SocketIO] Error saving result for {username}: {e}")
-    
-    print(f"[SocketIO] Saved {saved_count} results for quiz {quiz_id}")
+        # Use upsert to prevent duplicates (same player, same quiz, same mode)
+        operations.append(UpdateOne(
+            {
+                'quiz_id': quiz_oid,
+                'student_id': student_oid,
+                'mode': 'live_arena'
+            },
+            {'$set': result_doc},
+            upsert=True
+        ))
+        usernames.append(username)
+        logger.debug("[SocketIO] Result for %s: %s/%s (%s%%)", username, score, total_possible, percentage)
+    
+    # Write all results in a single round-trip
+    saved_count = len(operations)
+    try:
+        get_results_writer().bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        write_errors = e.details.get('writeErrors', [])
+        saved_count -= len(write_errors)
+        for error in write_errors:
+            logger.error("[SocketIO] Error saving result for %s: %s",
+                         usernames[error['index']], error.get('errmsg'))
+    except Exception:
+        saved_count = 0
+        logger.exception("[SocketIO] Error saving results for quiz %s", quiz_id)
+    
+    logger.info("[SocketIO] Saved %s results for quiz %s", saved_count, quiz_id)
     
     # Clean up in-memory state for this quiz
-    if quiz_id in live_players:
-        del live_players[quiz_id]
-    if quiz_id in live_scores:
-        del live_scores[quiz_id]
-    if quiz_id in live_quiz_state:
-        del live_quiz_state[quiz_id]
-    if quiz_id in live_ready_players:
-        del live_ready_players[quiz_id]
+    discard_live_quiz(quiz_id)
 
 @socketio.on('submit_answer')
 def handle_submit_answer(data):
@@ -553,67 +1013,82 @@ def handle_submit_answer(data):
         emit('error', {'message': 'Missing data'})
         return
     
-    # Get the quiz and question
-    _, quizzes_col, _ = get_collections()
-    quiz = quizzes_col.find_one({'_id': ObjectId(quiz_id)})
+    # Get the question from the quiz cached when the quiz started
+    quiz = live_quiz_state.get(quiz_id, {}).get('quiz')
     
     if not quiz:
-        emit('error', {'message': 'Quiz not found'})
+        emit('error', {'message': 'Quiz is not running'})
         return
     
-    questions = quiz.get('questions', [])
+    questions = live_quiz_state[quiz_id]['questions']
     if question_index < 0 or question_index >= len(questions):
         emit('error', {'message': 'Invalid question index'})
         return
     
     question = questions[question_index]
-    correct_answer = question.get('answer', '')
     q_type = question.get('type', 'mcq')
     points = question.get('points', 1)
     
-    # Check correctness based on question type
+    # Check correctness against the pre-normalized correct answer
     is_correct = False
-    if q_type == 'tf':
-        is_correct = str(correct_answer).strip().upper() == str(answer).strip().upper()
-    elif q_type == 'mcq':
-        is_correct = str(correct_answer).strip() == str(answer).strip()
-    elif q_type == 'short':
-        is_correct = str(answer).strip().lower() == str(correct_answer).strip().lower()
-    
-    # Update score
-    if quiz_id not in live_scores:
-        live_scores[quiz_id] = {}
-    if user_id not in live_scores[quiz_id]:
-        live_scores[quiz_id][user_id] = 0
+    if q_type in ('tf', 'mcq', 'short'):
+        is_correct = normalize_answer(q_type, answer) == question['_norm_answer']
     
+    # Update score (bind the room's score dict once; one read and one write)
+    scores = live_scores[quiz_id]
+    new_score = scores.get(user_id, 0)
     if is_correct:
-        live_scores[quiz_id][user_id] += points
-        print(f"[SocketIO] {user_id} answered correctly! +{points} points")
+        new_score += points
+        logger.debug("[SocketIO] %s answered correctly! +%s points", user_id, points)
     else:
-        print(f"[SocketIO] {user_id} answered incorrectly")
+        logger.debug("[SocketIO] %s answered incorrectly", user_id)
+    scores[user_id] = new_score
     
     room = f"quiz_{quiz_id}"
     
     # Send score update to the player who submitted
     emit('score_update', {
         'user_id': user_id,
-        'score': live_scores[quiz_id][user_id],
+        'score': new_score,
         'correct': is_correct,
         'points_earned': points if is_correct else 0
     })
     
-    # Broadcast live leaderboard to all players
-    leaderboard = []
-    for uid, score in sorted(live_scores.get(quiz_id, {}).items(), key=lambda x: x[1], reverse=True):
-        player_info = live_players.get(quiz_id, {}).get(uid, {})
-        leaderboard.append({
-            'user_id': uid,
-            'username': player_info.get('username', 'Unknown'),
-            'score': score
-        })
+    # Skip the room broadcast when the visible top 10 cannot have changed:
+    # the score is unchanged, or the player is outside a full top 10 and
+    # still below its lowest score
+    state = live_quiz_state[quiz_id]
+    top10_set = state.get('top10_set', set())
+    if not is_correct:
+        return
+    if (user_id not in top10_set and len(top10_set) >= 10
+            and new_score < state.get('top10_min_score', 0)):
+        return
+    
+    top = heapq.nlargest(10, scores.items(), key=lambda x: x[1])
+    state['top10_set'] = {uid for uid, _ in top}
+    state['top10_min_score'] = top[-1][1]
+    
+    # Throttle full leaderboard broadcasts; send only the changed score in between
+    usernames = state.get('usernames', {})
+    now = time.monotonic()
+    if now - state.get('last_broadcast_ts', 0) < LEADERBOARD_BROADCAST_INTERVAL:
+        socketio.emit('score_delta', {
+            'user_id': user_id,
+            'username': usernames.get(user_id, 'Unknown'),
+            'score': new_score
+        }, room=room)
+        return
+    state['last_broadcast_ts'] = now
+    
+    # Broadcast live leaderboard (top 10) to all players
+    leaderboard = [
+        {'user_id': uid, 'username': usernames.get(uid, 'Unknown'), 'score': score}
+        for uid, score in top
+    ]
     
     socketio.emit('live_leaderboard', {
-        'leaderboard': leaderboard[:10]  # Top 10
+        'leaderboard': leaderboard
     }, room=room)
 
 # =====================================================================
@@ -625,26 +1100,54 @@ def index():
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
-    users, _, _ = get_collections()
+    users = g.users
     if request.method == 'POST':
         email = request.form['email'].strip()
         password = request.form['password']
         role = request.form['role']
-        user_data = users.find_one({'email': email, 'role': role})
-        if user_data and check_password_hash(user_data['password'], password):
-            user = User(str(user_data['_id']), user_data['username'], user_data['role'])
-            login_user(user)
+        addr = request.remote_addr
+        if login_throttled(addr):
+            flash('Too many failed logins, try again in a minute')
+            return render_template('login.html'), 429
+
+        user_data = users.find_one({'email': email, 'role': role},
+                                   {'password': 1, 'username': 1, 'role': 1})
+        digest = login_cache_digest(email, role, password)
+        cached = login_cache.get(digest)
+        if (user_data is not None and cached and cached[0] > time.monotonic()
+                and hmac.compare_digest(cached[1], user_data['password'])):
+            start_session(User(str(user_data['_id']), user_data['username'], user_data['role']))
             return redirect(url_for('dashboard'))
+
+        if user_data is None:
+            # Hash anyway so unknown emails take as long as wrong passwords
+            verify_password(DUMMY_PASSWORD_HASH, password)
+        elif verify_password(user_data['password'], password):
+            stored_hash = user_data['password']
+            if password_needs_rehash(stored_hash):
+                new_hash = hash_password(password)
+                try:
+                    users.update_one({'_id': user_data['_id']}, {'$set': {'password': new_hash}})
+                    stored_hash = new_hash
+                except PyMongoError as e:
+                    logger.error("Password rehash failed: %s", e)
+            login_cache.pop(digest, None)
+            if len(login_cache) >= LOGIN_CACHE_MAX:
+                login_cache.pop(next(iter(login_cache)))
+            login_cache[digest] = (time.monotonic() + LOGIN_CACHE_TTL, stored_hash)
+            start_session(User(str(user_data['_id']), user_data['username'], user_data['role']))
+            return redirect(url_for('dashboard'))
+        record_login_failure(addr)
         flash('Invalid credentials')
     return render_template('login.html')
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
-    users, _, _ = get_collections()
+    users = g.users
     if request.method == 'POST':
         username = request.form['username'].strip()
         email = request.form['email'].strip().lower()
-        password = generate_password_hash(request.form['password'])
+        password = hash_password(request.form['password'])
         role = request.form.get('role', 'student')
         if role not in ['student', 'master']:
             role = 'student'
@@ -656,14 +1159,23 @@ def register():
             flash('Username already taken')
             return render_template('register.html')
 
-        user_id = users.insert_one({
-            'username': username,
-            'email': email,
-            'password': password,
-            'role': role
-        }).inserted_id
+        try:
+            user_id = users.insert_one({
+                'username': username,
+                'email': email,
+                'password': password,
+                'role': role
+            }).inserted_id
+        except DuplicateKeyError as e:
+            # A concurrent registration took the email or username after
+            # the checks above; the unique indexes reject the second insert
+            if 'email' in (e.details or {}).get('keyPattern', {}):
+                flash('Email already exists')
+            else:
+                flash('Username already taken')
+            return render_template('register.html')
         user = User(str(user_id), username, role)
-        login_user(user)
+        start_session(user)
         flash('Registration successful!')
         return redirect(url_for('dashboard'))
     return render_template('register.html')
@@ -673,6 +1185,31 @@ def register():
 def dashboard():
     return render_template('dashboard.html', user=current_user)
 
+# Question form fields: q_text_3, q_points_12, ... and MCQ options: option_3_2
+QUESTION_FIELD_RE = re.compile(r'^(q_text|q_type|q_answer|q_points|q_time)_(\d+)$')
+OPTION_FIELD_RE = re.compile(r'^option_(\d+)_(\d+)$')
+MAX_QUESTIONS = 50
+# Answer field names on the take-quiz form, built once instead of per submission
+ANSWER_KEYS = tuple(f"q_{i}" for i in range(1, MAX_QUESTIONS + 1))
+
+def group_question_fields(form):
+    """Group question form fields by question number in one pass over the form.
+    Returns { i: {'q_text': str, ..., 'options': { j: str }} } for i in 1..MAX_QUESTIONS."""
+    fields_by_question = {}
+    for key, value in form.items():
+        match = QUESTION_FIELD_RE.match(key)
+        if match:
+            field, i = match.group(1), int(match.group(2))
+            if 1 <= i <= MAX_QUESTIONS:
+                fields_by_question.setdefault(i, {'options': {}})[field] = value
+            continue
+        match = OPTION_FIELD_RE.match(key)
+        if match:
+            i, j = int(match.group(1)), int(match.group(2))
+            if 1 <= i <= MAX_QUESTIONS:
+                fields_by_question.setdefault(i, {'options': {}})['options'][j] = value
+    return fields_by_question
+
 @app.route('/create_quiz', methods=['GET', 'POST'])
 @login_required
 def create_quiz():
@@ -680,7 +1217,7 @@ def create_quiz():
         flash('Access denied')
         return redirect(url_for('dashboard'))
 
-    _, quizzes, _ = get_collections()
+    quizzes = g.quizzes
 
     if request.method == 'POST':
         title = request.form.get('title', '').strip()
@@ -696,15 +1233,17 @@ def create_quiz():
             return redirect(url_for('dashboard'))
 
         questions = []
-        for i in range(1, 51):
-            q_text = request.form.get(f'q_text_{i}', '').strip()
+        fields_by_question = group_question_fields(request.form)
+        for i in sorted(fields_by_question):
+            fields = fields_by_question[i]
+            q_text = fields.get('q_text', '').strip()
             if not q_text:
                 continue
 
-            q_type = request.form.get(f'q_type_{i}', 'mcq')
-            q_answer = request.form.get(f'q_answer_{i}', '').strip()
+            q_type = fields.get('q_type', 'mcq')
+            q_answer = fields.get('q_answer', '').strip()
             try:
-                q_points = int(request.form.get(f'q_points_{i}', 1))
+                q_points = int(fields.get('q_points', 1))
             except ValueError:
                 q_points = 1
 
@@ -713,7 +1252,7 @@ def create_quiz():
             
             # Parse time per question (seconds)
             try:
-                q_time = int(request.form.get(f'q_time_{i}', 30))
+                q_time = int(fields.get('q_time', 30))
             except ValueError:
                 q_time = 30
             
@@ -729,6 +1268,7 @@ def create_quiz():
                 'type': q_type,
                 'text': q_text,
                 'answer': q_answer,
+                'answer_norm': normalize_answer(q_type, q_answer),  # compared on submit
                 'points': q_points,
                 'time': q_time
             }
@@ -736,7 +1276,7 @@ def create_quiz():
             if q_type == 'mcq':
                 options = []
                 for j in range(1, 5):
-                    opt = request.form.get(f'option_{i}_{j}', '').strip()
+                    opt = fields['options'].get(j, '').strip()
                     if opt:
                         options.append(opt)
                 if len(options) < 2:
@@ -749,8 +1289,8 @@ def create_quiz():
         if len(questions) == 0:
             flash('Add at least one question')
             return redirect(url_for('dashboard'))
-        if len(questions) > 50:
-            flash('Maximum 50 questions allowed')
+        if len(questions) > MAX_QUESTIONS:
+            flash(f'Maximum {MAX_QUESTIONS} questions allowed')
             return redirect(url_for('dashboard'))
 
         try:
@@ -759,30 +1299,53 @@ def create_quiz():
                 'subject': subject,
                 'duration': duration,
                 'questions': questions,
-                'createdBy': ObjectId(current_user.id),
-                'date': datetime.now()
+                'total_points': sum(q['points'] for q in questions),
+                'createdBy': current_user.id_oid,
+                'date': datetime.now(timezone.utc)
             })
             flash(f'Quiz "{title}" created successfully!')
             return redirect(url_for('quizzes'))
-        except Exception as e:
+        except Exception:
             flash('Quiz creation failed – please try again')
-            print(f"DB Error: {e}")
+            logger.exception("DB Error")
 
     return redirect(url_for('dashboard'))
 
+# Quizzes shown per page on /quizzes
+QUIZZES_PER_PAGE = 20
+# Highest page accepted, so a huge ?page= cannot overflow the int64 $skip
+QUIZZES_MAX_PAGE = 10000
+
 @app.route('/quizzes')
 @login_required
 def quizzes():
-    _, quizzes_col, _ = get_collections()
-    if current_user.role == 'master':
-        quiz_list = list(quizzes_col.find({'createdBy': ObjectId(current_user.id)}).sort('date', -1))
-    else:
-        quiz_list = list(quizzes_col.find({}).sort('date', -1))
+    quizzes_col = g.quizzes
+    page = min(max(request.args.get('page', 1, type=int), 1), QUIZZES_MAX_PAGE)
+    query = {'createdBy': current_user.id_oid} if current_user.role == 'master' else {}
+
+    # One page of cards; the questions array is reduced to its size, and one
+    # extra row tells whether a next page exists
+    quiz_list = list(quizzes_col.aggregate([
+        {'$match': query},
+        {'$sort': {'date': -1}},
+        {'$skip': (page - 1) * QUIZZES_PER_PAGE},
+        {'$limit': QUIZZES_PER_PAGE + 1},
+        {'$project': {
+            'title': 1,
+            'subject': 1,
+            'duration': 1,
+            'date': 1,
+            'question_count': {'$size': {'$ifNull': ['$questions', []]}}
+        }}
+    ]))
+    has_next = len(quiz_list) > QUIZZES_PER_PAGE
+    quiz_list = quiz_list[:QUIZZES_PER_PAGE]
     
     for quiz in quiz_list:
         quiz['_id'] = str(quiz['_id'])
         
-    return render_template('quizzes.html', quizzes=quiz_list, user=current_user)
+    return render_template('quizzes.html', quizzes=quiz_list, user=current_user,
+                           page=page, has_next=has_next)
 
 # =====================================================================
 # LIVE QUIZ ARENA ROUTES
@@ -791,48 +1354,67 @@ def quizzes():
 @login_required
 def lobby(quiz_id):
     """Live quiz lobby - master can start, students can join"""
-    _, quizzes_col, _ = get_collections()
-    
-    try:
-        quiz = quizzes_col.find_one({'_id': ObjectId(quiz_id)})
-    except:
+    quiz_oid = parse_oid(quiz_id)
+    if quiz_oid is None:
         flash('Invalid quiz ID')
         return redirect(url_for('quizzes'))
+
+    quizzes_col = g.quizzes
+    
+    # The lobby only shows the question count, so the questions array
+    # is reduced to its size server-side
+    quiz = next(quizzes_col.aggregate([
+        {'$match': {'_id': quiz_oid}},
+        {'$project': {
+            'title': 1,
+            'subject': 1,
+            'duration': 1,
+            'createdBy': 1,
+            'date': 1,
+            'question_count': {'$size': {'$ifNull': ['$questions', []]}}
+        }}
+    ]), None)
     
     if not quiz:
         flash('Quiz not found')
         return redirect(url_for('quizzes'))
     
     # Check if user is the master (creator) of this quiz
-    is_master = str(quiz.get('createdBy')) == current_user.id
-    
-    # Initialize quiz state if not exists
-    if quiz_id not in live_quiz_state:
-        live_quiz_state[quiz_id] = {
+    is_master = quiz.get('createdBy') == current_user.id_oid
+    
+    # Initialize quiz state if not exists (socket handlers may have
+    # already created it to track usernames)
+    prune_stale_live_quizzes()
+    state = live_quiz_state[quiz_id]
+    state['last_active'] = time.monotonic()
+    if 'master_id' not in state:
+        state.update({
             'started': False,
             'current_question': 0,
-            'master_id': str(quiz.get('createdBy'))
-        }
+            'master_id': str(quiz.get('createdBy')),
+            '_oid': quiz['_id']
+        })
     
+    etag = quiz_etag(quiz)
     quiz['_id'] = str(quiz['_id'])
     
-    return render_template('lobby.html', 
-                           quiz=quiz, 
-                           user=current_user, 
-                           is_master=is_master,
-                           quiz_state=live_quiz_state.get(quiz_id, {}))
+    return render_conditional(etag, 'lobby.html', 
+                              quiz=quiz, 
+                              user=current_user, 
+                              is_master=is_master,
+                              quiz_state=live_quiz_state.get(quiz_id, {}))
 
 @app.route('/live_quiz/<quiz_id>')
 @login_required
 def live_quiz(quiz_id):
     """Live quiz gameplay page - receives real-time questions"""
-    _, quizzes_col, _ = get_collections()
-    
-    try:
-        quiz = quizzes_col.find_one({'_id': ObjectId(quiz_id)})
-    except:
+    quiz_oid = parse_oid(quiz_id)
+    if quiz_oid is None:
         flash('Invalid quiz ID')
         return redirect(url_for('quizzes'))
+
+    quizzes_col = g.quizzes
+    quiz = quizzes_col.find_one({'_id': quiz_oid}, {'title': 1, 'createdBy': 1})
     
     if not quiz:
         flash('Quiz not found')
@@ -844,7 +1426,7 @@ def live_quiz(quiz_id):
         flash('This quiz has not started yet')
         return redirect(url_for('lobby', quiz_id=quiz_id))
     
-    is_master = str(quiz.get('createdBy')) == current_user.id
+    is_master = quiz.get('createdBy') == current_user.id_oid
     quiz['_id'] = str(quiz['_id'])
     
     return render_template('live_quiz.html', 
@@ -856,53 +1438,46 @@ def live_quiz(quiz_id):
 @login_required
 def arena_standings(quiz_id):
     """Final standings/podium page after live quiz ends"""
-    _, quizzes_col, results_col = get_collections()
-    
-    try:
-        quiz = quizzes_col.find_one({'_id': ObjectId(quiz_id)})
-    except:
+    quiz_oid = parse_oid(quiz_id)
+    if quiz_oid is None:
         flash('Invalid quiz ID')
         return redirect(url_for('quizzes'))
+
+    quizzes_col, results_col = g.quizzes, g.results
+    quiz = quizzes_col.find_one({'_id': quiz_oid},
+                                {'title': 1, 'createdBy': 1, 'total_points': 1, 'questions.points': 1})
     
     if not quiz:
         flash('Quiz not found')
         return redirect(url_for('quizzes'))
     
-    # Get all results for this quiz from live arena
-    results = list(results_col.find({
-        'quiz_id': ObjectId(quiz_id),
-        'mode': 'live_arena'
-    }).sort('score', -1))
-    
-    # Deduplicate: keep only highest score per player
-    seen_players = set()
-    unique_results = []
-    for res in results:
-        player_id = str(res.get('student_id', ''))
-        if player_id not in seen_players:
-            seen_players.add(player_id)
-            unique_results.append(res)
-    results = unique_results
-    
-    # Calculate total possible
-    total_possible = sum(q.get('points', 1) for q in quiz.get('questions', []))
-    
-    # Prepare standings data
-    standings = []
-    for idx, res in enumerate(results):
-        standings.append({
-            'rank': idx + 1,
-            'username': res.get('student_name', 'Unknown'),
-            'score': res.get('score', 0),
-            'total_possible': total_possible,
-            'percentage': res.get('percentage', 0),
-            'user_id': str(res.get('student_id', ''))
-        })
+    total_possible = quiz_total_points(quiz)
     
-    # Get top 3 for podium
-    podium = standings[:3] if len(standings) >= 3 else standings
+    # Rank live arena results server-side: keep each player's best result
+    # and number them by score; the podium is the first three rows
+    pipeline = [
+        {'$match': {'quiz_id': quiz['_id'], 'mode': 'live_arena'}},
+        {'$sort': {'score': -1}},
+        {'$group': {'_id': '$student_id', 'best': {'$first': '$$ROOT'}}},
+        {'$setWindowFields': {
+            'sortBy': {'best.score': -1},
+            'output': {'rank': {'$documentNumber': {}}}
+        }},
+        {'$project': {
+            '_id': 0,
+            'rank': 1,
+            'username': {'$ifNull': ['$best.student_name', 'Unknown']},
+            'score': {'$ifNull': ['$best.score', 0]},
+            'total_possible': {'$literal': total_possible},
+            'percentage': {'$ifNull': ['$best.percentage', 0]},
+            'user_id': {'$ifNull': [{'$toString': '$_id'}, '']}
+        }},
+        {'$sort': {'rank': 1}}
+    ]
+    standings = list(results_col.aggregate(pipeline))
+    podium = standings[:3]
     
-    is_master = str(quiz.get('createdBy')) == current_user.id
+    is_master = quiz.get('createdBy') == current_user.id_oid
     quiz['_id'] = str(quiz['_id'])
     
     return render_template('arena_standings.html',
@@ -916,9 +1491,17 @@ def arena_standings(quiz_id):
 @login_required
 def arena_history():
     """Show history of all arena sessions"""
-    _, quizzes_col, results_col = get_collections()
+    results_col = g.results
+    
+    if current_user.role == 'master':
+        # Masters see all sessions for their quizzes
+        can_view = {'quiz.createdBy': current_user.id_oid}
+    else:
+        # Students see sessions they participated in
+        can_view = {'sessions.student_name': current_user.username}
     
-    # Get unique quiz IDs from live arena results
+    # Group live arena results per quiz, then join quiz details and filter
+    # server-side; sessions of deleted quizzes drop out at the $match
     pipeline = [
         {'$match': {'mode': 'live_arena'}},
         {'$group': {
@@ -934,37 +1517,34 @@ def arena_history():
             'last_played': {'$max': '$date'}
         }},
         {'$sort': {'last_played': -1}},
-        {'$limit': 50}
+        {'$limit': 50},
+        {'$lookup': {
+            'from': 'quizzes',
+            'localField': '_id',
+            'foreignField': '_id',
+            # Reduce each joined quiz to what the page shows before it is
+            # attached, so the questions arrays never enter the pipeline
+            'pipeline': [{'$project': {
+                'title': 1,
+                'subject': 1,
+                'createdBy': 1,
+                'question_count': {'$size': {'$ifNull': ['$questions', []]}}
+            }}],
+            'as': 'quiz'
+        }},
+        {'$unwind': '$quiz'},
+        {'$match': can_view},
+        {'$addFields': {
+            'quiz_title': {'$ifNull': ['$quiz.title', 'Unknown Quiz']},
+            'quiz_subject': {'$ifNull': ['$quiz.subject', 'N/A']},
+            'question_count': '$quiz.question_count'
+        }},
+        {'$project': {'quiz': 0}}
     ]
     
     arena_sessions = list(results_col.aggregate(pipeline))
-    
-    # Enrich with quiz details
-    for session in arena_sessions:
-        quiz = quizzes_col.find_one({'_id': session['_id']})
-        if quiz:
-            session['quiz_title'] = quiz.get('title', 'Unknown Quiz')
-            session['quiz_subject'] = quiz.get('subject', 'N/A')
-            session['question_count'] = len(quiz.get('questions', []))
-            if current_user.role == 'master':
-                # Masters see all sessions for their quizzes
-                session['can_view'] = str(quiz.get('createdBy')) == current_user.id
-            else:
-                # Students see sessions they participated in
-                session['can_view'] = any(
-                    s.get('student_name') == current_user.username 
-                    for s in session.get('sessions', [])
-                )
-        else:
-            session['quiz_title'] = 'Deleted Quiz'
-            session['quiz_subject'] = 'N/A'
-            session['question_count'] = 0
-            session['can_view'] = False
-        
-        session['_id'] = str(session['_id'])
-    
-    # Filter to only show relevant sessions
-    arena_sessions = [s for s in arena_sessions if s.get('can_view', False)]
+    for arena_session in arena_sessions:
+        arena_session['_id'] = str(arena_session['_id'])
     
     return render_template('arena_history.html',
                            sessions=arena_sessions,
@@ -977,20 +1557,26 @@ def take_quiz(quiz_id):
         flash('Access denied')
         return redirect(url_for('dashboard'))
 
-    _, quizzes_col, _ = get_collections()
-    try:
-        quiz = quizzes_col.find_one({'_id': ObjectId(quiz_id)})
-    except:
+    quiz_oid = parse_oid(quiz_id)
+    if quiz_oid is None:
         flash('Invalid quiz ID')
         return redirect(url_for('quizzes'))
 
+    quizzes_col = g.quizzes
+    # Only what the page renders: the answers never leave the database here
+    quiz = quizzes_col.find_one({'_id': quiz_oid},
+                                {'title': 1, 'subject': 1, 'duration': 1, 'date': 1,
+                                 'questions.text': 1, 'questions.type': 1,
+                                 'questions.points': 1, 'questions.options': 1})
+
     if not quiz:
         flash('Quiz not found')
         return redirect(url_for('quizzes'))
 
+    etag = quiz_etag(quiz)
     quiz['duration_seconds'] = int(quiz['duration']) * 60
     quiz['_id'] = str(quiz['_id'])
-    return render_template('take_quiz.html', quiz=quiz)
+    return render_conditional(etag, 'take_quiz.html', quiz=quiz)
 
 @app.route('/submit_quiz/<quiz_id>', methods=['POST'])
 @login_required
@@ -998,37 +1584,38 @@ def submit_quiz(quiz_id):
     if current_user.role != 'student':
         return redirect(url_for('dashboard'))
 
-    _, quizzes_col, results_col = get_collections()
-    try:
-        quiz = quizzes_col.find_one({'_id': ObjectId(quiz_id)})
-    except:
+    quiz_oid = parse_oid(quiz_id)
+    if quiz_oid is None:
         return redirect(url_for('quizzes'))
 
+    quizzes_col = g.quizzes
+    quiz = quizzes_col.find_one({'_id': quiz_oid},
+                                {'title': 1, 'total_points': 1,
+                                 'questions.text': 1, 'questions.type': 1, 'questions.points': 1,
+                                 'questions.answer': 1, 'questions.answer_norm': 1})
+
     if not quiz:
         flash('Quiz not found')
         return redirect(url_for('quizzes'))
 
-    answers = {}
-    for i, q in enumerate(quiz['questions']):
-        q_key = f"q_{i+1}"
-        ans = request.form.get(q_key, '').strip()
-        answers[q_key] = ans
+    total = quiz_total_points(quiz)
 
+    # Read, grade and record each answer in a single pass
+    form_get = request.form.get
     score = 0
-    total = sum(q['points'] for q in quiz['questions'])
     scored_answers = []
-    
     for i, q in enumerate(quiz['questions']):
-        q_key = f"q_{i+1}"
-        ans = answers.get(q_key, '')
+        key = ANSWER_KEYS[i] if i < MAX_QUESTIONS else f"q_{i + 1}"
+        ans = form_get(key, '').strip()
+        q_type = q['type']
         
         correct = False
-        if q['type'] == 'tf':
-            correct = str(q['answer']).strip().upper() == str(ans).strip().upper()
-        elif q['type'] == 'mcq':
-            correct = str(q['answer']).strip() == str(ans).strip()
-        elif q['type'] == 'short':
-            correct = ans.lower() == q['answer'].lower()
+        if q_type in ('tf', 'mcq', 'short'):
+            # answer_norm is stored at create/edit time; older quizzes lack it
+            expected = q.get('answer_norm')
+            if expected is None:
+                expected = normalize_answer(q_type, q['answer'])
+            correct = normalize_answer(q_type, ans) == expected
             
         if correct:
             score += q['points']
@@ -1038,111 +1625,181 @@ def submit_quiz(quiz_id):
             'student_answer': ans,
             'correct_answer': q['answer'],
             'correct': correct,
-            'type': q['type'],
+            'type': q_type,
             'points': q['points']
         })
 
     percentage = round((score / total * 100), 2) if total > 0 else 0
 
-    results_col.insert_one({
-        'user': ObjectId(current_user.id),
+    result_doc = {
+        'user': current_user.id_oid,
         'username': current_user.username,
-        'quiz': ObjectId(quiz_id),
+        'quiz': quiz_oid,
+        'quiz_title': quiz['title'],
         'answers': scored_answers,
         'score': score,
         'total': total,
         'percentage': percentage,
-        'date': datetime.now()
-    })
+        'date': datetime.now(timezone.utc)
+    }
+    # Retakes are allowed, so duplicates are keyed on the page-load token
+    # rather than (user, quiz); the unique index rejects a resubmitted attempt
+    attempt = form_get('attempt', '')[:64]
+    if attempt:
+        result_doc['attempt'] = attempt
+    try:
+        result_id = get_results_writer().insert_one(result_doc).inserted_id
+    except DuplicateKeyError:
+        flash('Already submitted')
+        return redirect(url_for('my_results'))
+    # Keep the precomputed leaderboard in step with the results collection
+    try:
+        get_leaderboard_col().update_one(
+            {'_id': current_user.id_oid},
+            {'$inc': {'totalScore': score}, '$set': {'username': current_user.username}},
+            upsert=True
+        )
+    except PyMongoError as e:
+        logger.error("Leaderboard update failed for %s (run `flask rebuild-leaderboard` to repair): %s",
+                     current_user.username, e)
+    leaderboard_cache['expires'] = 0.0
+
+    # Post/Redirect/Get: refreshing the result page no longer resubmits the form
+    return redirect(url_for('view_result', rid=str(result_id)))
 
-    return render_template('results.html', score=score, total=total, percentage=percentage,
-                           answers=scored_answers, quiz_title=quiz['title'])
+@app.route('/result/<rid>')
+@login_required
+def view_result(rid):
+    result_oid = parse_oid(rid)
+    if result_oid is None:
+        flash('Result not found')
+        return redirect(url_for('my_results'))
+
+    results_col = g.results
+    result = results_col.find_one({'_id': result_oid, 'user': current_user.id_oid},
+                                  {'quiz': 1, 'quiz_title': 1, 'answers': 1,
+                                   'score': 1, 'total': 1, 'percentage': 1})
+    if not result:
+        flash('Result not found')
+        return redirect(url_for('my_results'))
+
+    quiz_title = result.get('quiz_title')
+    if quiz_title is None:  # results saved before the title was stored on them
+        quiz = g.quizzes.find_one({'_id': result.get('quiz')}, {'title': 1})
+        quiz_title = quiz['title'] if quiz else None
+
+    # A submitted result never changes, so a revalidation is answered with
+    # 304; it is still revalidated every time so a shared browser cannot show
+    # it after logout
+    etag = f"result-{result['_id']}-{current_user.id}-{ETAG_BUILD}"
+    return render_conditional(etag, 'results.html', score=result['score'],
+                              total=result['total'], percentage=result['percentage'],
+                              answers=result['answers'], quiz_title=quiz_title)
+
+# Rows listed on my_results (newest first); the summary cards still count
+# every result
+MY_RESULTS_LIMIT = 200
 
 @app.route('/my_results')
 @login_required
 def my_results():
-    users, quizzes_col, results_col = get_collections()
+    results_col = g.results
 
     if current_user.role == 'student':
         # Find results for both solo quiz ('user') and live arena ('student_id')
-        raw_results = list(results_col.find({
+        query = {
             '$or': [
-                {'user': ObjectId(current_user.id)},
-                {'student_id': ObjectId(current_user.id)}
+                {'user': current_user.id_oid},
+                {'student_id': current_user.id_oid}
             ]
-        }).sort('date', -1))
+        }
     else:
-        raw_results = list(results_col.find({}).sort('date', -1))
+        query = {}
 
-    enriched_results = []
-    for res in raw_results:
-        # Handle both field naming conventions
-        quiz_id_field = res.get('quiz') or res.get('quiz_id')
-        user_id_field = res.get('user') or res.get('student_id')
-        
-        quiz = quizzes_col.find_one({'_id': quiz_id_field}) if quiz_id_field else None
-        student = users.find_one({'_id': user_id_field}) if user_id_field else None
-
-        # Get student name from result (live arena) or from user lookup
-        student_name = res.get('student_name') or (student['username'] if student else 'Unknown')
-        
-        # Get total from result - handle both 'total' and 'total_possible'
-        total = res.get('total') or res.get('total_possible', 0)
-        
-        # Get mode (solo or live_arena)
-        mode = res.get('mode', 'solo')
-
-        enriched_results.append({
-            '_id': str(res['_id']),
-            'score': res['score'],
-            'total': total,
-            'percentage': res.get('percentage', 0),
-            'date': res['date'],
-            'quiz_title': res.get('quiz_title') or (quiz['title'] if quiz else 'Deleted Quiz'),
-            'quiz_subject': quiz['subject'] if quiz else '',
-            'student_name': student_name,
-            'mode': mode
-        })
+    # Summary cards are computed server-side so the rows can be streamed
+    stats = next(results_col.aggregate([
+        {'$match': query},
+        {'$group': {
+            '_id': None,
+            'count': {'$sum': 1},
+            'avg_percentage': {'$avg': {'$ifNull': ['$percentage', 0]}},
+            'live_count': {'$sum': {'$cond': [{'$eq': ['$mode', 'live_arena']}, 1, 0]}}
+        }}
+    ]), None) or {'count': 0, 'avg_percentage': 0, 'live_count': 0}
+
+    # Quiz and student names are joined server-side, one round trip per cursor
+    # batch; both field conventions ('quiz'/'user' for solo results,
+    # 'quiz_id'/'student_id' for live arena ones) are handled in the pipeline
+    cursor = results_col.aggregate([
+        {'$match': query},
+        {'$sort': {'date': -1}},
+        {'$limit': MY_RESULTS_LIMIT},
+        {'$addFields': {
+            'quiz_ref': {'$ifNull': ['$quiz', '$quiz_id']},
+            'user_ref': {'$ifNull': ['$user', '$student_id']}
+        }},
+        {'$lookup': {
+            'from': 'quizzes',
+            'localField': 'quiz_ref',
+            'foreignField': '_id',
+            'pipeline': [{'$project': {'title': 1, 'subject': 1}}],
+            'as': 'quiz_doc'
+        }},
+        {'$lookup': {
+            'from': 'users',
+            'localField': 'user_ref',
+            'foreignField': '_id',
+            'pipeline': [{'$project': {'username': 1}}],
+            'as': 'student'
+        }},
+        {'$project': {
+            'score': 1,
+            'date': 1,
+            'total': {'$ifNull': ['$total', {'$ifNull': ['$total_possible', 0]}]},
+            'percentage': {'$ifNull': ['$percentage', 0]},
+            'quiz_title': {'$ifNull': [
+                '$quiz_title',
+                {'$ifNull': [{'$arrayElemAt': ['$quiz_doc.title', 0]}, 'Deleted Quiz']}
+            ]},
+            'quiz_subject': {'$ifNull': [{'$arrayElemAt': ['$quiz_doc.subject', 0]}, '']},
+            'student_name': {'$ifNull': [
+                '$student_name',
+                {'$ifNull': [{'$arrayElemAt': ['$student.username', 0]}, 'Unknown']}
+            ]},
+            'mode': {'$ifNull': ['$mode', 'solo']}
+        }}
+    ])
+    return stream_template('my_results.html',
+                           results=cursor,
+                           stats=stats,
+                           user=current_user)
 
-    return render_template('my_results.html', results=enriched_results, user=current_user)
+# Top 10 is shared by every viewer, so it is cached in-process and rebuilt
+# at most once per LEADERBOARD_CACHE_TTL seconds per worker (or after a
+# submission in this worker changes the totals)
+LEADERBOARD_CACHE_TTL = 30
+leaderboard_cache = {'expires': 0.0, 'entries': []}
 
 @app.route('/leaderboard')
 @login_required
 def leaderboard():
-    users, _, results_col = get_collections()
+    now = time.monotonic()
+    if now < leaderboard_cache['expires']:
+        return render_template('leaderboard.html', leaderboard=leaderboard_cache['entries'])
 
-    pipeline = [
-        {'$match': {'score': {'$exists': True}}},
-        {'$group': {
-            '_id': '$user',
-            'totalScore': {'$sum': '$score'}
-        }},
-        {'$sort': {'totalScore': -1}},
-        {'$limit': 10}
-    ]
-    
+    # Totals are maintained on submit, so this is an indexed top-10 read
     try:
-        agg_results = list(results_col.aggregate(pipeline))
-    except Exception as e:
-        print(f"Aggregation Error: {e}")
-        agg_results = []
-
-    top_users = []
-    for agg in agg_results:
-        uid = agg['_id']
-        username = 'Unknown Student'
-        if uid:
-            try:
-                u = users.find_one({'_id': ObjectId(uid)})
-                if u: 
-                    username = u.get('username', 'Unknown')
-            except:
-                pass
-        
-        top_users.append({
-            'username': username,
-            'score': agg['totalScore']
-        })
+        top_users = [
+            {'username': entry.get('username', 'Unknown Student'), 'score': entry['totalScore']}
+            for entry in get_leaderboard_col().find(
+                {}, {'_id': 0, 'username': 1, 'totalScore': 1}
+            ).sort('totalScore', -1).limit(10)
+        ]
+    except Exception:
+        logger.exception("Leaderboard Error")
+        top_users = []
+    else:
+        leaderboard_cache.update(expires=now + LEADERBOARD_CACHE_TTL, entries=top_users)
         
     return render_template('leaderboard.html', leaderboard=top_users)
 
@@ -1153,12 +1810,13 @@ def edit_quiz(quiz_id):
         flash('Access denied')
         return redirect(url_for('dashboard'))
 
-    _, quizzes_col, _ = get_collections()
-    try:
-        quiz = quizzes_col.find_one({'_id': ObjectId(quiz_id), 'createdBy': ObjectId(current_user.id)})
-    except:
+    quiz_oid = parse_oid(quiz_id)
+    if quiz_oid is None:
         flash('Invalid Quiz ID')
         return redirect(url_for('quizzes'))
+
+    quizzes_col = g.quizzes
+    quiz = quizzes_col.find_one({'_id': quiz_oid, 'createdBy': current_user.id_oid})
         
     if not quiz:
         flash('Quiz not found or access denied')
@@ -1178,20 +1836,33 @@ def edit_quiz(quiz_id):
             return render_template('edit_quiz.html', quiz=quiz)
 
         questions = []
-        for i in range(1, 51):
-            q_text = request.form.get(f'q_text_{i}', '').strip()
+        fields_by_question = group_question_fields(request.form)
+        for i in sorted(fields_by_question):
+            fields = fields_by_question[i]
+            q_text = fields.get('q_text', '').strip()
             if not q_text:
                 continue
 
-            q_type = request.form.get(f'q_type_{i}', 'mcq')
-            q_answer = request.form.get(f'q_answer_{i}', '').strip()
+            q_type = fields.get('q_type', 'mcq')
+            q_answer = fields.get('q_answer', '').strip()
             try:
-                q_points = int(request.form.get(f'q_points_{i}', 1))
+                q_points = int(fields.get('q_points', 1))
             except ValueError:
                 q_points = 1
             if q_points < 1:
                 q_points = 1
 
+            # Parse time per question (seconds), as create_quiz does
+            try:
+                q_time = int(fields.get('q_time', 30))
+            except ValueError:
+                q_time = 30
+
+            if q_time < 5:
+                q_time = 5
+            elif q_time > 120:
+                q_time = 120
+
             if q_type == 'tf':
                 q_answer = q_answer.upper()
 
@@ -1199,13 +1870,15 @@ def edit_quiz(quiz_id):
                 'type': q_type,
                 'text': q_text,
                 'answer': q_answer,
-                'points': q_points
+                'answer_norm': normalize_answer(q_type, q_answer),  # compared on submit
+                'points': q_points,
+                'time': q_time
             }
 
             if q_type == 'mcq':
                 options = []
                 for j in range(1, 5):
-                    opt = request.form.get(f'option_{i}_{j}', '').strip()
+                    opt = fields['options'].get(j, '').strip()
                     if opt:
                         options.append(opt)
                 if len(options) < 2:
@@ -1219,22 +1892,36 @@ def edit_quiz(quiz_id):
             flash('Add at least one question')
             return render_template('edit_quiz.html', quiz=quiz)
 
+        changes = {
+            'title': title,
+            'subject': subject,
+            'duration': duration,
+            'total_points': sum(q['points'] for q in questions),
+            'date': datetime.now(timezone.utc)
+        }
+        # Rewrite only the questions that changed, so a one-word fix does not
+        # replace (and replicate) the whole array; a different count, or
+        # every question changing (e.g. older quizzes gaining answer_norm),
+        # replaces it in one $set
+        old_questions = quiz.get('questions', [])
+        changed = [i for i, (old_q, new_q) in enumerate(zip(old_questions, questions))
+                   if old_q != new_q]
+        if len(old_questions) != len(questions) or len(changed) == len(questions):
+            changes['questions'] = questions
+        else:
+            for i in changed:
+                changes[f'questions.{i}'] = questions[i]
+
         try:
             quizzes_col.update_one(
-                {'_id': ObjectId(quiz_id)},
-                {'$set': {
-                    'title': title,
-                    'subject': subject,
-                    'duration': duration,
-                    'questions': questions,
-                    'date': datetime.now()
-                }}
+                {'_id': quiz_oid, 'createdBy': current_user.id_oid},
+                {'$set': changes}
             )
             flash('Quiz updated successfully!')
             return redirect(url_for('quizzes'))
-        except Exception as e:
+        except Exception:
             flash('Update failed – please try again')
-            print(f"DB Error: {e}")
+            logger.exception("DB Error")
 
     quiz['_id'] = str(quiz['_id'])
     return render_template('edit_quiz.html', quiz=quiz)
@@ -1246,26 +1933,40 @@ def delete_quiz(quiz_id):
         flash('Access denied')
         return redirect(url_for('dashboard'))
 
-    _, quizzes_col, _ = get_collections()
-    try:
-        quiz = quizzes_col.find_one({'_id': ObjectId(quiz_id), 'createdBy': ObjectId(current_user.id)})
-    except:
+    quiz_oid = parse_oid(quiz_id)
+    if quiz_oid is None:
         return redirect(url_for('quizzes'))
-        
-    if quiz:
-        quizzes_col.delete_one({'_id': ObjectId(quiz_id)})
+
+    # Ownership is part of the filter, so a quiz owned by someone else matches nothing
+    quizzes_col = g.quizzes
+    if quizzes_col.delete_one({'_id': quiz_oid, 'createdBy': current_user.id_oid}).deleted_count:
         flash('Quiz deleted successfully!')
     return redirect(url_for('quizzes'))
 
 @app.route('/logout')
 @login_required
 def logout():
+    session.pop('u_name', None)
+    session.pop('u_role', None)
+    session.pop('u_checked', None)
     logout_user()
     return redirect(url_for('login'))
 
 # =====================================================================
-# RUN WITH SOCKETIO (gevent backend)
+# WARM MONGODB CONNECTION
+# =====================================================================
+# Connect at startup so the first request doesn't pay for TCP/TLS and
+# server discovery while holding a greenlet
+if app.config['MONGO_URI']:
+    try:
+        get_db()
+        client.admin.command('ping')
+    except Exception as e:
+        logger.error("MongoDB warm-up failed: %s", e)
+
+# =====================================================================
+# RUN WITH SOCKETIO (eventlet backend)
 # =====================================================================
 if __name__ == '__main__':
-    print("[FLUX] Starting server with gevent backend...")
+    print("[FLUX] Starting server with eventlet backend...")
     socketio.run(app, debug=False, host='0.0.0.0', port=int(os.getenv('PORT', 5000)))